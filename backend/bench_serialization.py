@@ -0,0 +1,93 @@
+"""Benchmark: CPU spent serializing one 100-item page of GET /api/items.
+
+Compares the old path (validate through List[ItemResponse], jsonable_encoder,
+json.dumps) with the ORJSONResponse path, and shows what gzip/brotli cost and save.
+With images on, most of the page is incompressible base64, which is why the
+server sends image-dominated bodies uncompressed; --image-kb 0 shows a text-only page.
+
+    python bench_serialization.py [--rounds 50] [--image-kb 60]
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'lostaf_bench')
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from server import ItemResponse, brotli
+
+def make_image_url(image_kb: int) -> str:
+    return "data:image/jpeg;base64," + base64.b64encode(os.urandom(image_kb * 768)).decode()
+
+def make_page(size: int, image_kb: int) -> list:
+    # A fresh image per row: a shared one lets the compressor back-reference it and flatters the ratio
+    now = datetime.now(timezone.utc).isoformat()
+    return [{
+        "id": str(uuid.uuid4()),
+        "type": "lost" if i % 2 else "found",
+        "title": f"Blue water bottle {i}",
+        "category": "Accessories",
+        "location": "Library",
+        "date": "2025-11-08",
+        "description": "Steel bottle with a dent near the cap and a sticker on the side.",
+        "image_url": make_image_url(image_kb),
+        "user_name": "Test User",
+        "user_email": "test.user@cvru.ac.in",
+        "is_anonymous": False,
+        "status": "active",
+        "created_at": now,
+        "matches": [{"id": str(uuid.uuid4()), "title": "Bottle", "similarity": 0.83}]
+    } for i in range(size)]
+
+def cpu_ms(func, rounds: int) -> float:
+    start = time.process_time()
+    for _ in range(rounds):
+        func()
+    return (time.process_time() - start) * 1000 / rounds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--image-kb', type=int, default=60)
+    args = parser.parse_args()
+
+    page = make_page(args.page_size, args.image_kb)
+    adapter = TypeAdapter(List[ItemResponse])
+
+    def pydantic_path():
+        validated = adapter.validate_python(page)
+        return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode()
+
+    def orjson_path():
+        return orjson.dumps(page)
+
+    body = orjson_path()
+    results = [
+        ("response_model + json.dumps", cpu_ms(pydantic_path, args.rounds), len(pydantic_path())),
+        ("ORJSONResponse", cpu_ms(orjson_path, args.rounds), len(body)),
+    ]
+    for level in (1, 6):
+        results.append((f"gzip level {level}", cpu_ms(lambda: gzip.compress(body, level), args.rounds),
+                        len(gzip.compress(body, level))))
+    if brotli:
+        for quality in (1, 4):
+            results.append((f"brotli quality {quality}", cpu_ms(lambda: brotli.compress(body, quality=quality), args.rounds),
+                            len(brotli.compress(body, quality=quality))))
+
+    print(f"{args.page_size}-item page, ~{args.image_kb} KB image_url per item, {args.rounds} rounds")
+    for name, ms, size in results:
+        print(f"  {name:<30} {ms:8.2f} ms CPU/page  {size / 1024:10.1f} KB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""Shared CLIP embedding service.
+
+Runs the model once in a dedicated process and serves every API worker over a
+Unix socket, batching requests that arrive close together into one encode call.
+
+    python embedding_service.py --socket /tmp/lostaf-embedding.sock
+
+API workers use it when EMBEDDING_SERVICE_SOCKET points at the same path.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_SOCKET = '/tmp/lostaf-embedding.sock'
+DEFAULT_MODEL = 'clip-ViT-B-32'
+
+# ============ Wire protocol ============
+# Every message is: uint32 header length | JSON header | uint32 payload length | payload.
+# Image requests carry raw RGB pixels so the service sees exactly what the worker resized.
+_LENGTH = struct.Struct('>I')
+
+def _pack_frame(header: dict, payload: bytes = b'') -> bytes:
+    header_bytes = json.dumps(header).encode()
+    return _LENGTH.pack(len(header_bytes)) + header_bytes + _LENGTH.pack(len(payload)) + payload
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def _recv_frame(sock: socket.socket) -> tuple:
+    header = json.loads(_recv_exact(sock, _LENGTH.unpack(_recv_exact(sock, 4))[0]))
+    payload = _recv_exact(sock, _LENGTH.unpack(_recv_exact(sock, 4))[0])
+    return header, payload
+
+async def _read_frame(reader: asyncio.StreamReader) -> tuple:
+    header_len = _LENGTH.unpack(await reader.readexactly(4))[0]
+    header = json.loads(await reader.readexactly(header_len))
+    payload_len = _LENGTH.unpack(await reader.readexactly(4))[0]
+    payload = await reader.readexactly(payload_len) if payload_len else b''
+    return header, payload
+
+class EmbeddingServiceBusy(RuntimeError):
+    """The service already has more inputs queued than it accepts."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Embedding service is busy")
+        self.retry_after = retry_after
+
+def _unpack_embeddings(header: dict, payload: bytes) -> np.ndarray:
+    if header.get('busy'):
+        raise EmbeddingServiceBusy(header.get('retry_after', 1))
+    if 'error' in header:
+        raise RuntimeError(f"Embedding service error: {header['error']}")
+    return np.frombuffer(payload, dtype=np.float32).reshape(header['count'], header['dim'])
+
+
+# ============ Client ============
+class EmbeddingClient:
+    """Blocking client for the embedding service; safe to call from threadpool workers."""
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._model = None
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+            self._local.sock = None
+
+    def _exchange(self, header: dict, payload: bytes = b'') -> tuple:
+        frame = _pack_frame(header, payload)
+        # Retry once on a fresh connection in case the service was restarted
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                sock.sendall(frame)
+                response = _recv_frame(sock)
+                if 'model' in response[0]:
+                    self._model = response[0]['model']
+                return response
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt:
+                    raise
+
+    def _request(self, header: dict, payload: bytes = b'') -> np.ndarray:
+        return _unpack_embeddings(*self._exchange(header, payload))
+
+    def model_name(self) -> str:
+        """Name of the model the service runs; asked once, then refreshed by every response."""
+        if self._model is None:
+            self._exchange({"kind": "info"})
+        return self._model
+
+    def encode_images(self, images: List[Image.Image]) -> np.ndarray:
+        rgb = [image if image.mode == 'RGB' else image.convert('RGB') for image in images]
+        header = {"kind": "image", "sizes": [list(image.size) for image in rgb]}
+        return self._request(header, b''.join(image.tobytes() for image in rgb))
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        return self._request({"kind": "text", "texts": list(texts)})
+
+
+# ============ Service ============
+class _Request:
+    __slots__ = ('kind', 'inputs', 'future')
+
+    def __init__(self, kind: str, inputs: list, future: asyncio.Future):
+        self.kind = kind
+        self.inputs = inputs
+        self.future = future
+
+class EmbeddingBatcher:
+    """Collects requests from all connections and encodes them in shared batches."""
+
+    def __init__(self, model, max_batch: int, max_wait: float, max_pending: int):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # Every API worker shares this service, so this is the deployment-wide inference backlog
+        self.max_pending = max_pending
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending = 0
+        self.batches = 0
+        self.encoded = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def retry_after(self) -> int:
+        average = self.total_seconds / self.batches if self.batches else 1.0
+        return max(1, int(average * (self.pending / self.max_batch + 1)) + 1)
+
+    def has_room(self, count: int) -> bool:
+        # A single request larger than the limit is still let through when nothing is queued
+        if self.pending and self.pending + count > self.max_pending:
+            self.rejected += 1
+            return False
+        return True
+
+    async def submit(self, kind: str, inputs: list) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        self.pending += len(inputs)
+        try:
+            await self.queue.put(_Request(kind, inputs, future))
+            return await future
+        finally:
+            self.pending -= len(inputs)
+
+    def _encode(self, inputs: list) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(inputs, batch_size=len(inputs), convert_to_numpy=True),
+            dtype=np.float32
+        )
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0].inputs)
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(request)
+                size += len(request.inputs)
+
+            for kind in ('image', 'text'):
+                group = [request for request in pending if request.kind == kind]
+                if not group:
+                    continue
+                inputs = [value for request in group for value in request.inputs]
+                started = time.monotonic()
+                try:
+                    embeddings = await loop.run_in_executor(None, self._encode, inputs)
+                except Exception as e:
+                    logging.error(f"Embedding batch failed: {e}")
+                    for request in group:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                    continue
+
+                self.batches += 1
+                self.encoded += len(inputs)
+                self.total_seconds += time.monotonic() - started
+                offset = 0
+                for request in group:
+                    count = len(request.inputs)
+                    if not request.future.done():
+                        request.future.set_result(embeddings[offset:offset + count])
+                    offset += count
+
+def _decode_images(header: dict, payload: bytes) -> List[Image.Image]:
+    images = []
+    offset = 0
+    for width, height in header['sizes']:
+        size = width * height * 3
+        images.append(Image.frombytes('RGB', (width, height), payload[offset:offset + size]))
+        offset += size
+    return images
+
+async def _handle_connection(batcher: EmbeddingBatcher, model_name: str, reader, writer):
+    try:
+        while True:
+            try:
+                header, payload = await _read_frame(reader)
+            except asyncio.IncompleteReadError:
+                break
+            try:
+                kind = header.get('kind')
+                if kind == 'info':
+                    writer.write(_pack_frame({"model": model_name, "count": 0, "dim": 0}))
+                    await writer.drain()
+                    continue
+                if kind == 'image':
+                    count = len(header['sizes'])
+                elif kind == 'text':
+                    count = len(header['texts'])
+                else:
+                    raise ValueError(f"Unknown request kind: {kind}")
+                if not batcher.has_room(count):
+                    writer.write(_pack_frame({"busy": True, "retry_after": batcher.retry_after()}))
+                    await writer.drain()
+                    continue
+                inputs = _decode_images(header, payload) if kind == 'image' else list(header['texts'])
+                embeddings = await batcher.submit(kind, inputs) if inputs else np.zeros((0, 0), np.float32)
+                response = _pack_frame(
+                    {"model": model_name, "count": embeddings.shape[0], "dim": embeddings.shape[1]},
+                    embeddings.astype(np.float32).tobytes()
+                )
+            except Exception as e:
+                response = _pack_frame({"error": str(e)})
+            writer.write(response)
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(socket_path: str, model_name: str, max_batch: int, max_wait_ms: float, max_pending: int):
+    from sentence_transformers import SentenceTransformer
+
+    print(f"Loading {model_name} model...")
+    model = SentenceTransformer(model_name)
+    print(f"{model_name} model loaded successfully")
+
+    batcher = EmbeddingBatcher(model, max_batch, max_wait_ms / 1000.0, max_pending)
+    asyncio.create_task(batcher.run())
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: _handle_connection(batcher, model_name, reader, writer),
+        path=socket_path
+    )
+    os.chmod(socket_path, 0o660)
+    logging.info(f"Embedding service listening on {socket_path}")
+
+    started = time.monotonic()
+    async with server:
+        while True:
+            await asyncio.sleep(60)
+            uptime = int(time.monotonic() - started)
+            logging.info(
+                f"Embedding service: {batcher.encoded} inputs in {batcher.batches} batches, "
+                f"{batcher.rejected} requests rejected as busy, uptime {uptime}s"
+            )
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Shared CLIP embedding service for LostAF API workers")
+    parser.add_argument('--socket', default=os.environ.get('EMBEDDING_SERVICE_SOCKET', DEFAULT_SOCKET))
+    parser.add_argument('--model', default=os.environ.get('EMBEDDING_MODEL', DEFAULT_MODEL))
+    parser.add_argument('--max-batch', type=int, default=int(os.environ.get('EMBEDDING_MAX_BATCH', '64')))
+    parser.add_argument('--max-wait-ms', type=float, default=float(os.environ.get('EMBEDDING_MAX_WAIT_MS', '5')))
+    parser.add_argument('--max-pending', type=int, default=int(os.environ.get('EMBEDDING_MAX_PENDING', '256')),
+                        help="Queued inputs beyond this are rejected as busy")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(serve(args.socket, args.model, args.max_batch, args.max_wait_ms, args.max_pending))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""One-off data migrations.
+
+    python migrate.py datetimes [--batch-size 500]
+    python migrate.py phash [--batch-size 500]
+    python migrate.py match-pairs
+
+datetimes: rewrites timestamps stored as ISO strings by older versions of the
+API as native BSON datetimes. Safe to re-run; only string values are touched.
+Run it before deploying code that expects native datetimes.
+
+phash: computes perceptual hashes for items posted before duplicate detection
+existed, so re-posts of their photos are recognised too.
+
+match-pairs: stores every match with its item ids in sorted order and removes
+pairs that were saved twice, once per orientation. Run it before the unique
+index on (item1_id, item2_id) can be created.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import logging
+from datetime import datetime, timezone
+
+from PIL import Image
+from pymongo import UpdateOne
+
+from server import client, db, image_dhash, phash_bands
+
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "user_sessions": ["expires_at", "created_at"],
+    "items": ["created_at", "updated_at"],
+    "matches": ["created_at"],
+    "import_jobs": ["created_at", "finished_at"],
+}
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+async def migrate_field(collection, field: str, batch_size: int) -> int:
+    converted = 0
+    last_id = None
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await collection.find(query, {field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            return converted
+
+        operations = []
+        for doc in docs:
+            try:
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"], field: doc[field]},
+                    {"$set": {field: parse_timestamp(doc[field])}}
+                ))
+            except ValueError:
+                logging.warning(f"{collection.name}.{field}: unparseable value {doc[field]!r} on {doc['_id']}")
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            converted += result.modified_count
+        last_id = docs[-1]["_id"]
+
+async def migrate_datetimes(batch_size: int):
+    for collection_name, fields in DATETIME_FIELDS.items():
+        for field in fields:
+            converted = await migrate_field(db[collection_name], field, batch_size)
+            logging.info(f"{collection_name}.{field}: converted {converted} documents")
+
+def hash_data_url(image_url: str) -> str:
+    image = Image.open(io.BytesIO(base64.b64decode(image_url.split(",", 1)[1])))
+    return image_dhash(image.convert("RGB"))
+
+async def migrate_phash(batch_size: int):
+    hashed = 0
+    last_id = None
+    while True:
+        query = {"image_url": {"$ne": None}, "image_phash": None}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = await db.items.find(query, {"image_url": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+
+        operations = []
+        for doc in docs:
+            try:
+                phash = hash_data_url(doc["image_url"])
+            except Exception as e:
+                logging.warning(f"items: could not hash image of {doc['_id']}: {e}")
+                continue
+            operations.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"image_phash": phash, "phash_bands": phash_bands(phash)}}
+            ))
+        if operations:
+            result = await db.items.bulk_write(operations, ordered=False)
+            hashed += result.modified_count
+        last_id = docs[-1]["_id"]
+    logging.info(f"items: hashed {hashed} images")
+
+async def migrate_match_pairs():
+    kept = {}
+    swapped = removed = 0
+    async for match in db.matches.find({}, {"item1_id": 1, "item2_id": 1, "notified": 1}).sort("created_at", 1):
+        pair = tuple(sorted((match["item1_id"], match["item2_id"])))
+        if pair in kept:
+            # The earliest match stays; it counts as notified if either copy was
+            if match.get("notified"):
+                await db.matches.update_one({"_id": kept[pair]}, {"$set": {"notified": True}})
+            await db.matches.delete_one({"_id": match["_id"]})
+            removed += 1
+            continue
+        kept[pair] = match["_id"]
+        if pair != (match["item1_id"], match["item2_id"]):
+            await db.matches.update_one({"_id": match["_id"]}, {"$set": {"item1_id": pair[0], "item2_id": pair[1]}})
+            swapped += 1
+    logging.info(f"matches: reordered {swapped}, removed {removed} duplicates")
+
+def main():
+    parser = argparse.ArgumentParser(description="LostAF data migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    datetimes = subparsers.add_parser("datetimes", help="Convert ISO string timestamps to native datetimes")
+    datetimes.add_argument("--batch-size", type=int, default=500)
+    phash = subparsers.add_parser("phash", help="Compute perceptual hashes for existing item images")
+    phash.add_argument("--batch-size", type=int, default=500)
+    subparsers.add_parser("match-pairs", help="Store match pairs in sorted order and drop duplicates")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "datetimes":
+            asyncio.run(migrate_datetimes(args.batch_size))
+        elif args.command == "phash":
+            asyncio.run(migrate_phash(args.batch_size))
+        elif args.command == "match-pairs":
+            asyncio.run(migrate_match_pairs())
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
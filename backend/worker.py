@@ -0,0 +1,41 @@
+"""Job worker process.
+
+Claims jobs from the Mongo `jobs` collection (matching, match notifications)
+and runs them outside the API processes. Start as many as you need, on any host
+that can reach Mongo:
+
+    python worker.py --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+
+from server import client, job_worker_loop, watch_changes
+
+async def run_workers(concurrency: int, poll_interval: float):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    logging.info(f"Starting {concurrency} job workers as {worker_id}")
+    # Keeps this process's match index in step with writes from the API replicas
+    asyncio.create_task(watch_changes())
+    await asyncio.gather(*[
+        job_worker_loop(f"{worker_id}-{index}", poll_interval)
+        for index in range(concurrency)
+    ])
+
+def main():
+    parser = argparse.ArgumentParser(description="LostAF background job worker")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("JOB_WORKER_CONCURRENCY", "4")))
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_workers(args.concurrency, args.poll_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads these at import time; nothing in these tests talks to Mongo
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'lostaf_test')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
@@ -0,0 +1,229 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import server
+from embedding_service import EmbeddingServiceBusy
+from server import InferenceGate, SharedTokenBucketLimiter, TokenBucketLimiter, client_ip
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_reject(clock):
+    limiter = TokenBucketLimiter(rate_per_minute=6, burst=3)
+    assert [limiter.acquire("u") for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Empty bucket at 0.1 tokens/s: the next token is 10 s away
+    assert limiter.acquire("u") == pytest.approx(10.0)
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_refills_over_time_up_to_burst(clock):
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=2)
+    limiter.acquire("u")
+    limiter.acquire("u")
+    assert limiter.acquire("u") > 0
+
+    clock[0] += 1.0
+    assert limiter.acquire("u") == 0.0
+    assert limiter.acquire("u") > 0
+
+    # A long idle period refills to the burst size, not beyond it
+    clock[0] += 3600
+    assert [limiter.acquire("u") for _ in range(2)] == [0.0, 0.0]
+    assert limiter.acquire("u") > 0
+
+
+def test_keys_are_independent(clock):
+    limiter = TokenBucketLimiter(rate_per_minute=6, burst=1)
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") > 0
+    assert limiter.acquire("b") == 0.0
+
+
+def test_evicts_least_recently_seen_keys(clock):
+    limiter = TokenBucketLimiter(rate_per_minute=6, burst=1, max_keys=2)
+    limiter.acquire("a")
+    limiter.acquire("b")
+    limiter.acquire("a")
+    limiter.acquire("c")
+    assert list(limiter.buckets) == ["a", "c"]
+    # An evicted key starts over with a full bucket
+    assert limiter.acquire("b") == 0.0
+
+
+def test_zero_rate_never_refills(clock):
+    limiter = TokenBucketLimiter(rate_per_minute=0, burst=1)
+    assert limiter.acquire("u") == 0.0
+    clock[0] += 3600
+    assert limiter.acquire("u") == 60.0
+
+
+class FakeRateLimits:
+    """Runs the limiter's update pipeline against dicts, evaluating just the operators it uses."""
+
+    def __init__(self):
+        self.docs = {}
+        self.fail = False
+
+    def evaluate(self, expr, doc):
+        if isinstance(expr, str) and expr.startswith("$"):
+            return doc.get(expr[1:])
+        if not isinstance(expr, dict):
+            return expr
+        (op, args), = expr.items()
+        values = [self.evaluate(arg, doc) for arg in args]
+        if op == "$ifNull":
+            return values[0] if values[0] is not None else values[1]
+        if op == "$subtract":
+            difference = values[0] - values[1]
+            # Date minus date is milliseconds in Mongo
+            return difference.total_seconds() * 1000 if hasattr(difference, "total_seconds") else difference
+        if op == "$cond":
+            return values[1] if values[0] else values[2]
+        return {
+            "$divide": lambda: values[0] / values[1],
+            "$multiply": lambda: values[0] * values[1],
+            "$add": lambda: values[0] + values[1],
+            "$min": lambda: min(values),
+            "$gte": lambda: values[0] >= values[1],
+        }[op]()
+
+    async def find_one_and_update(self, query, pipeline, upsert=False, return_document=None):
+        if self.fail:
+            raise ConnectionError("no primary")
+        doc = dict(self.docs.get(query["_id"], query))
+        for stage in pipeline:
+            doc.update({field: self.evaluate(expr, doc) for field, expr in stage["$set"].items()})
+        self.docs[query["_id"]] = doc
+        return doc
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    now = [datetime(2025, 1, 1, tzinfo=timezone.utc)]
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now[0]
+
+    rate_limits = FakeRateLimits()
+    monkeypatch.setattr(server, "datetime", FrozenDatetime)
+    monkeypatch.setattr(server, "db", SimpleNamespace(rate_limits=rate_limits))
+    return SimpleNamespace(now=now, rate_limits=rate_limits)
+
+
+def test_shared_limiter_burst_refill_and_expiry(shared):
+    limiter = SharedTokenBucketLimiter("upload_user", rate_per_minute=6, burst=2)
+
+    async def take(count):
+        return [await limiter.acquire("u1") for _ in range(count)]
+
+    assert asyncio.run(take(3)) == [0.0, 0.0, pytest.approx(10.0)]
+    bucket = shared.rate_limits.docs["upload_user:u1"]
+    # Idle documents expire once the bucket would be full again
+    assert bucket["expires_at"] == shared.now[0] + timedelta(seconds=20)
+
+    shared.now[0] += timedelta(seconds=5)
+    assert asyncio.run(take(1)) == [pytest.approx(5.0)]
+    shared.now[0] += timedelta(seconds=5)
+    assert asyncio.run(take(1)) == [0.0]
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["rejected"] == 2
+
+
+def test_shared_limiter_falls_back_to_local_buckets(shared, clock):
+    limiter = SharedTokenBucketLimiter("upload_ip", rate_per_minute=6, burst=1)
+    shared.rate_limits.fail = True
+
+    async def take(count):
+        return [await limiter.acquire("10.0.0.1") for _ in range(count)]
+
+    waits = asyncio.run(take(2))
+    assert waits[0] == 0.0
+    assert waits[1] > 0
+    assert limiter.stats()["fallbacks"] == 2
+
+
+def gate_request(gate, shed=True, error=None):
+    async def run():
+        async with gate.slot(shed=shed):
+            if error:
+                raise error
+    return run()
+
+
+def test_inference_gate_sheds_when_backlog_is_full():
+    async def scenario():
+        gate = InferenceGate(max_inflight=1, max_backlog=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(gate_request(gate))
+        await asyncio.sleep(0)
+        assert (gate.in_flight, gate.waiting) == (1, 1)
+
+        with pytest.raises(HTTPException) as shed:
+            await gate_request(gate)
+        # Background work waits its turn instead of being shed
+        background = asyncio.create_task(gate_request(gate, shed=False))
+        release.set()
+        await asyncio.gather(holder, queued, background)
+        return gate, shed.value
+
+    gate, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+    assert gate.stats()["shed"] == 1
+    assert gate.stats()["completed"] == 3
+    assert (gate.in_flight, gate.waiting) == (0, 0)
+
+
+def test_inference_gate_maps_service_busy_to_503():
+    gate = InferenceGate(max_inflight=2, max_backlog=4)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(gate_request(gate, error=EmbeddingServiceBusy(7)))
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "7"
+    assert gate.stats()["shed"] == 1
+
+    # Jobs retry on their own schedule, so they see the original error
+    with pytest.raises(EmbeddingServiceBusy):
+        asyncio.run(gate_request(gate, shed=False, error=EmbeddingServiceBusy(7)))
+    assert gate.semaphore._value == 2
+
+
+def forwarded_request(forwarded=None, peer="10.0.0.9"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 5000)})
+
+
+@pytest.mark.parametrize("trust, hops, forwarded, expected", [
+    (False, 1, "1.2.3.4", "10.0.0.9"),
+    (True, 1, None, "10.0.0.9"),
+    (True, 1, "1.2.3.4", "1.2.3.4"),
+    # A client-supplied entry sits left of what our proxy appended
+    (True, 1, "6.6.6.6, 1.2.3.4", "1.2.3.4"),
+    (True, 2, "6.6.6.6, 1.2.3.4, 172.16.0.2", "1.2.3.4"),
+    (True, 2, "1.2.3.4", "1.2.3.4"),
+    (True, 1, " , ", "10.0.0.9"),
+])
+def test_client_ip(monkeypatch, trust, hops, forwarded, expected):
+    monkeypatch.setattr(server, "TRUST_FORWARDED_FOR", trust)
+    monkeypatch.setattr(server, "TRUSTED_PROXY_HOPS", hops)
+    assert client_ip(forwarded_request(forwarded)) == expected
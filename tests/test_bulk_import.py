@@ -0,0 +1,74 @@
+import io
+import zipfile
+
+from PIL import Image
+
+from server import iter_manifest_rows, prepare_import_rows
+
+
+def manifest(text):
+    return io.BytesIO(text.encode("utf-8"))
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def archive_with(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
+def test_jsonl_rows_skip_blank_lines_and_flag_bad_json():
+    rows = list(iter_manifest_rows(manifest('{"title": "a"}\n\n{broken\n{"title": "b"}\n'), "jsonl"))
+    assert rows == [(1, {"title": "a"}), (3, None), (4, {"title": "b"})]
+
+
+def test_csv_rows_strip_bom():
+    rows = list(iter_manifest_rows(manifest("﻿type,title\nlost,Bottle\nfound,Keys\n"), "csv"))
+    assert rows == [(1, {"type": "lost", "title": "Bottle"}), (2, {"type": "found", "title": "Keys"})]
+
+
+def row(**overrides):
+    values = {
+        "type": "Found", "title": "Bottle", "category": "Accessories", "location": "Library",
+        "date": "2025-11-08", "description": "Steel bottle", "is_anonymous": "yes",
+    }
+    values.update(overrides)
+    return values
+
+
+def test_prepare_rows_validates_and_loads_images():
+    archive = archive_with({"bottle.png": png_bytes()})
+    prepared, errors = prepare_import_rows(archive, [
+        (1, row(image="bottle.png")),
+        (2, row(image="")),
+        (3, row(type="misplaced")),
+        (4, row(image="missing.png")),
+        (5, None),
+    ])
+
+    assert [number for number, _, _ in prepared] == [1, 2]
+    number, fields, image = prepared[0]
+    assert fields.type == "found"
+    assert fields.is_anonymous is True
+    assert image.size == (32, 32)
+    assert prepared[1][2] is None
+
+    assert [error["row"] for error in errors] == [3, 4, 5]
+    assert "lost" in errors[0]["error"]
+    assert "missing.png" in errors[1]["error"]
+    assert errors[2]["error"] == "Malformed manifest row"
+
+
+def test_prepare_rows_reports_unreadable_images():
+    archive = archive_with({"broken.png": b"not an image"})
+    prepared, errors = prepare_import_rows(archive, [(1, row(image="broken.png"))])
+    assert prepared == []
+    assert errors[0]["row"] == 1
@@ -0,0 +1,111 @@
+import asyncio
+import base64
+import gzip
+import os
+
+import pytest
+
+import server
+from server import CompressionMiddleware, choose_encoding, image_data_share
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+    ("GZIP", "gzip"),
+    ("gzip;q=bogus", None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(server, "brotli", None)
+    assert choose_encoding("br, gzip") == "gzip"
+    assert choose_encoding("br") is None
+
+
+def test_image_data_share():
+    image = b'"data:image/jpeg;base64,' + base64.b64encode(os.urandom(3000)) + b'"'
+    assert image_data_share(b'[{"title": "Keys"}]') == 0
+    assert image_data_share(b'[{"image_url": ' + image + b'}]') > 0.9
+    assert image_data_share(b'') == 0
+
+
+def app_sending(chunks, content_type=b"application/json"):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type)]})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+    return app
+
+
+def call(app, accept_encoding="gzip"):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, receive, send))
+    start = messages[0]
+    return dict(start["headers"]), messages[1:]
+
+
+def test_streamed_body_is_compressed_chunk_by_chunk():
+    rows = [b'{"id": %d, "title": "Blue water bottle"}\n' % i for i in range(200)]
+    chunks = [b"".join(rows[i:i + 50]) for i in range(0, 200, 50)]
+    headers, bodies = call(app_sending(chunks, b"application/x-ndjson"))
+
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    assert [body["more_body"] for body in bodies] == [True, True, True, False]
+    assert gzip.decompress(b"".join(body["body"] for body in bodies)) == b"".join(chunks)
+
+
+def test_large_chunks_compress_on_a_worker_thread(monkeypatch):
+    offloaded = []
+
+    async def run_in_threadpool(func, *args):
+        offloaded.append(len(args[0]))
+        return func(*args)
+
+    monkeypatch.setattr(server, "run_in_threadpool", run_in_threadpool)
+    monkeypatch.setattr(server, "COMPRESSION_THREAD_SIZE", 1000)
+    body = b'{"title": "Blue water bottle"}' * 100
+    headers, bodies = call(app_sending([body[:500], body[500:]]))
+
+    assert offloaded == [len(body) - 500]
+    assert gzip.decompress(b"".join(message["body"] for message in bodies)) == body
+
+
+def test_single_body_gets_content_length():
+    body = b'{"title": "Blue water bottle"}' * 20
+    headers, bodies = call(app_sending([body]))
+    assert int(headers[b"content-length"]) == len(bodies[0]["body"])
+    assert gzip.decompress(bodies[0]["body"]) == body
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (b'{"ok": true}', b"application/json"),
+    (b'{"image_url": "data:image/jpeg;base64,' + base64.b64encode(os.urandom(3000)) + b'"}', b"application/json"),
+    (b"\x89PNG" + os.urandom(500), b"image/png"),
+])
+def test_small_image_heavy_and_binary_bodies_pass_through(body, content_type):
+    headers, bodies = call(app_sending([body], content_type))
+    assert b"content-encoding" not in headers
+    assert bodies[0]["body"] == body
+
+
+def test_no_accepted_encoding_passes_through():
+    body = b'{"title": "Blue water bottle"}' * 20
+    headers, bodies = call(app_sending([body]), accept_encoding="identity")
+    assert b"content-encoding" not in headers
+    assert bodies[0]["body"] == body
@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import EmbeddingMigrationRequest, fail_reembed, start_embedding_migration
+
+OLD = "clip-ViT-B-32"
+NEW = "clip-ViT-L-14"
+
+
+def lookup(doc, path):
+    for part in path.split("."):
+        doc = (doc or {}).get(part)
+    return doc
+
+
+class FakeCollection:
+    """Equality filters on dotted paths, dotted $set/$unset."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one(self, query, projection=None):
+        return next((doc for doc in self.docs if all(lookup(doc, k) == v for k, v in query.items())), None)
+
+    async def update_one(self, query, update):
+        doc = await self.find_one(query)
+        if doc is None:
+            return SimpleNamespace(modified_count=0)
+        for path, value in update.get("$set", {}).items():
+            parent, leaf = self.parent(doc, path)
+            parent[leaf] = value
+        for path in update.get("$unset", {}):
+            parent, leaf = self.parent(doc, path)
+            parent.pop(leaf, None)
+        return SimpleNamespace(modified_count=1)
+
+    @staticmethod
+    def parent(doc, path):
+        *parents, leaf = path.split(".")
+        for part in parents:
+            doc = doc.setdefault(part, {})
+        return doc, leaf
+
+
+@pytest.fixture
+def migration(monkeypatch):
+    settings = {"_id": "embedding", "active_model": OLD, "target_model": None, "migration": None}
+    jobs = []
+
+    async def enqueue_job(kind, payload, idempotency_key=None, run_at=None):
+        jobs.append({"id": f"job-{len(jobs) + 1}", "kind": kind, "payload": payload, "status": "queued"})
+        return jobs[-1]["id"]
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(settings=FakeCollection([settings]), jobs=FakeCollection(jobs)))
+    monkeypatch.setattr(server, "enqueue_job", enqueue_job)
+    server.embedding_settings_cache.clear()
+    return SimpleNamespace(settings=settings, jobs=jobs)
+
+
+def migrate(target):
+    return asyncio.run(start_embedding_migration(EmbeddingMigrationRequest(target_model=target), user=None))
+
+
+def test_failed_promotion_can_be_restarted(migration):
+    migrate(NEW)
+    assert migration.settings["migration"]["status"] == "running"
+    with pytest.raises(HTTPException) as busy:
+        migrate(NEW)
+    assert busy.value.status_code == 409
+
+    # The job switched models, then ran out of retries while promoting
+    migration.settings.update(active_model=NEW, target_model=None)
+    migration.settings["migration"].update(status="promoting", switched_at="t")
+    migration.jobs[0]["status"] = "failed"
+    asyncio.run(fail_reembed({"target_model": NEW}, "timeout"))
+    assert migration.settings["migration"]["status"] == "failed"
+
+    result = migrate(NEW)
+    assert result == {"job_id": "job-2", "target_model": NEW}
+    assert migration.jobs[1]["payload"] == {"target_model": NEW}
+    assert migration.settings["target_model"] is None
+    assert migration.settings["migration"]["status"] == "promoting"
+    assert "error" not in migration.settings["migration"]
+
+    # The promotion job is running again: another request waits for it
+    with pytest.raises(HTTPException) as busy:
+        migrate(NEW)
+    assert busy.value.status_code == 409
+
+
+def test_active_model_is_rejected_without_a_failed_switch(migration):
+    with pytest.raises(HTTPException) as error:
+        migrate(OLD)
+    assert error.value.status_code == 400
+
+    # Failed before the switch: nothing of the target is active, so the old model is still "already active"
+    migration.settings["migration"] = {"job_id": "job-0", "status": "failed"}
+    with pytest.raises(HTTPException) as error:
+        migrate(OLD)
+    assert error.value.status_code == 400
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+import pytest
+from starlette.requests import Request
+
+import server
+from server import cached_json_response, conditional_response, etag_matches, item_etag, page_etag
+
+
+def request_with(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('W/"abc"', True),
+    ('"abc"', True),
+    ('W/"other", W/"abc"', True),
+    ('*', True),
+    ('W/"abcd"', False),
+    ('', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(request_with(header), 'W/"abc"') is expected
+
+
+def test_item_etag_changes_with_version_and_archive_flag():
+    doc = {"id": "i1", "version": 2, "updated_at": datetime(2025, 1, 1, tzinfo=timezone.utc)}
+    assert item_etag(doc) != item_etag({**doc, "version": 3})
+    assert item_etag(doc) != item_etag(doc, include_archived=True)
+    # Items written before versioning still get a tag from their timestamp
+    assert item_etag({"id": "i1", "created_at": doc["updated_at"]}).startswith('W/"i1-0-')
+
+
+def test_page_etag_depends_on_rows_and_order():
+    page = [{"id": "a", "version": 1}, {"id": "b", "version": 1}]
+    params = {"type": "lost"}
+    assert page_etag(page, params) == page_etag(list(page), dict(params))
+    assert page_etag(page, params) != page_etag(page[::-1], params)
+    assert page_etag(page, params) != page_etag([page[0], {"id": "b", "version": 2}], params)
+    assert page_etag(page, params) != page_etag(page, {"type": "found"})
+
+
+def test_conditional_response_serves_304_then_cached_body(monkeypatch):
+    monkeypatch.setattr(server, "response_cache", {})
+    etag = 'W/"i1-2-x"'
+    assert conditional_response(request_with(), etag) is None
+
+    first = cached_json_response(etag, {"id": "i1"})
+    assert first.headers["etag"] == etag
+    not_modified = conditional_response(request_with(etag), etag)
+    assert not_modified.status_code == 304
+    assert not_modified.body == b""
+    # Another client without the tag gets the stored bytes instead of a fresh query
+    assert conditional_response(request_with(), etag).body == first.body
+
+
+def test_oversized_bodies_are_not_cached(monkeypatch):
+    monkeypatch.setattr(server, "response_cache", {})
+    monkeypatch.setattr(server, "RESPONSE_CACHE_BYTES", 10)
+    cached_json_response('W/"big"', {"description": "x" * 100})
+    assert server.response_cache == {}
@@ -0,0 +1,73 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from server import chain_cursors, export_response, export_since, stream_export
+
+CREATED = datetime(2025, 11, 8, 9, 30, tzinfo=timezone.utc)
+
+
+async def cursor_over(docs):
+    for doc in docs:
+        yield doc
+
+
+def collect(chunks):
+    async def run():
+        return [chunk async for chunk in chunks]
+    return asyncio.run(run())
+
+
+def docs(count):
+    return [{"id": f"i{n}", "title": f"Bottle {n}", "created_at": CREATED, "matches": ["m1"]} for n in range(count)]
+
+
+def test_ndjson_keeps_only_requested_fields():
+    chunks = collect(stream_export(cursor_over(docs(2)), ["id", "created_at", "status"], "ndjson"))
+    rows = [json.loads(line) for line in "".join(chunks).splitlines()]
+    # Missing fields are left out rather than written as null
+    assert rows == [{"id": "i0", "created_at": "2025-11-08T09:30:00+00:00"}, {"id": "i1", "created_at": "2025-11-08T09:30:00+00:00"}]
+
+
+def test_csv_has_header_and_flattens_values():
+    chunks = collect(stream_export(cursor_over(docs(1)), ["id", "created_at", "matches", "status"], "csv"))
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows == [["id", "created_at", "matches", "status"], ["i0", "2025-11-08T09:30:00+00:00", '["m1"]', ""]]
+
+
+def test_empty_export_still_has_csv_header():
+    assert collect(stream_export(cursor_over([]), ["id"], "csv")) == ["id\r\n"]
+    assert collect(stream_export(cursor_over([]), ["id"], "ndjson")) == []
+
+
+def test_output_is_flushed_in_chunks(monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_CHUNK_SIZE", 100)
+    chunks = collect(stream_export(cursor_over(docs(20)), ["id", "title"], "ndjson"))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 100 + 40 for chunk in chunks)
+    assert len("".join(chunks).splitlines()) == 20
+
+
+def test_chain_cursors_reads_collections_in_order():
+    chained = chain_cursors([cursor_over([{"id": "a"}]), cursor_over([{"id": "b"}, {"id": "c"}])])
+    assert [doc["id"] for doc in collect(chained)] == ["a", "b", "c"]
+
+
+def test_export_since_assumes_utc():
+    assert export_since(None) is None
+    assert export_since(datetime(2025, 1, 1)) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def test_export_response_rejects_unknown_format():
+    with pytest.raises(HTTPException) as error:
+        export_response(cursor_over([]), ["id"], "xml", "items")
+    assert error.value.status_code == 400
+    response = export_response(cursor_over([]), ["id"], "csv", "items")
+    assert response.media_type == "text/csv"
+    assert response.headers["content-disposition"] == 'attachment; filename="items.csv"'
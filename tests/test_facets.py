@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import compute_facets, facet_filter
+
+
+def test_facet_filter():
+    assert facet_filter(None, None, None, None) == {}
+    assert facet_filter("lost", " Bags ", "", "active") == {"type": "lost", "category": "Bags", "status": "active"}
+    # status=all counts every status
+    assert facet_filter(None, None, "Library", "all") == {"location": "Library"}
+    assert facet_filter("  ", None, None, None) == {}
+
+
+@pytest.fixture
+def aggregations(monkeypatch):
+    pipelines = []
+    result = {
+        "type": [{"_id": "lost", "count": 3}, {"_id": "found", "count": 2}],
+        "category": [{"_id": "Bags", "count": 4}, {"_id": None, "count": 1}],
+        "location": [{"_id": "Library", "count": 5}],
+        "status": [{"_id": "active", "count": 5}],
+    }
+
+    def aggregate(pipeline):
+        pipelines.append(pipeline)
+
+        async def to_list(length):
+            return [result]
+        return SimpleNamespace(to_list=to_list)
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(items=SimpleNamespace(aggregate=aggregate)))
+    monkeypatch.setattr(server, "facets_cache", {})
+    return pipelines
+
+
+def test_compute_facets_runs_one_cached_aggregation(aggregations):
+    facets = asyncio.run(compute_facets({"status": "active"}))
+    assert facets["type"] == [{"value": "lost", "count": 3}, {"value": "found", "count": 2}]
+    # Items without a category are left out of that facet but still counted in the total
+    assert facets["category"] == [{"value": "Bags", "count": 4}]
+    assert facets["total"] == 5
+    assert aggregations[0][0] == {"$match": {"status": "active"}}
+    assert set(aggregations[0][1]["$facet"]) == {"type", "category", "location", "status"}
+
+    assert asyncio.run(compute_facets({"status": "active"})) is facets
+    assert len(aggregations) == 1
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import run_job
+
+WORKER = "worker-1"
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for run_job: equality filters and $set updates."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def update_one(self, query, update):
+        for doc in self.docs:
+            if all(doc.get(key) == value for key, value in query.items()):
+                doc.update(update.get("$set", {}))
+                return SimpleNamespace(modified_count=1)
+        return SimpleNamespace(modified_count=0)
+
+
+def claimed_job(kind="test_job", attempts=1, max_attempts=3):
+    return {
+        "id": "job-1",
+        "kind": kind,
+        "payload": {"value": 1},
+        "status": "running",
+        "worker_id": WORKER,
+        "attempts": attempts,
+        "max_attempts": max_attempts,
+        "lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=60),
+    }
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    def install(job):
+        monkeypatch.setattr(server, "db", SimpleNamespace(jobs=FakeCollection([job])))
+        return job
+    return install
+
+
+def register(monkeypatch, handler, on_failure=None):
+    monkeypatch.setitem(server.JOB_HANDLERS, "test_job", handler)
+    if on_failure:
+        monkeypatch.setitem(server.JOB_FAILURE_HANDLERS, "test_job", on_failure)
+
+
+def test_success_marks_done(jobs, monkeypatch):
+    seen = []
+
+    async def handler(payload):
+        seen.append(payload)
+
+    register(monkeypatch, handler)
+    job = jobs(claimed_job())
+    asyncio.run(run_job(dict(job), WORKER))
+    assert seen == [{"value": 1}]
+    assert job["status"] == "done"
+    assert job["finished_at"] is not None
+    assert job["lease_expires_at"] is None
+
+
+def test_failure_requeues_with_backoff(jobs, monkeypatch):
+    async def handler(payload):
+        raise RuntimeError("boom")
+
+    register(monkeypatch, handler)
+    job = jobs(claimed_job(attempts=2))
+    before = datetime.now(timezone.utc)
+    asyncio.run(run_job(dict(job), WORKER))
+    assert job["status"] == "queued"
+    assert job["last_error"] == "boom"
+    # Second attempt waits base * 2 ** (attempts - 1)
+    expected = timedelta(seconds=server.JOB_RETRY_BASE_SECONDS * 2)
+    assert job["run_at"] - before >= expected
+    assert job["run_at"] - before < expected + timedelta(seconds=5)
+
+
+def test_last_attempt_fails_and_runs_failure_hook(jobs, monkeypatch):
+    failures = []
+
+    async def handler(payload):
+        raise ValueError("bad input")
+
+    async def on_failure(payload, error):
+        failures.append((payload, error))
+
+    register(monkeypatch, handler, on_failure)
+    job = jobs(claimed_job(attempts=3, max_attempts=3))
+    asyncio.run(run_job(dict(job), WORKER))
+    assert job["status"] == "failed"
+    assert job["last_error"] == "bad input"
+    assert failures == [({"value": 1}, "bad input")]
+
+
+def test_unknown_kind_fails_without_retry(jobs):
+    job = jobs(claimed_job(kind="no_such_job"))
+    asyncio.run(run_job(dict(job), WORKER))
+    assert job["status"] == "failed"
+    assert "No handler" in job["last_error"]
+
+
+def test_too_many_expired_leases_fails_without_running(jobs, monkeypatch):
+    calls = []
+
+    async def handler(payload):
+        calls.append(payload)
+
+    register(monkeypatch, handler)
+    job = jobs(claimed_job(attempts=4, max_attempts=3))
+    asyncio.run(run_job(dict(job), WORKER))
+    assert calls == []
+    assert job["status"] == "failed"
+
+
+def test_lost_lease_does_not_overwrite_new_owner(jobs, monkeypatch):
+    async def handler(payload):
+        # Another worker reclaimed the job after our lease ran out
+        server.db.jobs.docs[0]["worker_id"] = "worker-2"
+
+    register(monkeypatch, handler)
+    job = jobs(claimed_job())
+    asyncio.run(run_job(dict(job), WORKER))
+    assert job["status"] == "running"
+    assert job["worker_id"] == "worker-2"
@@ -0,0 +1,177 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import MatchIndex, poll_changes
+
+MODEL = "clip-ViT-B-32"
+
+
+def make_item(item_id, vector, type="found", category="Bags", location="Library", status="active", model=MODEL):
+    return {
+        "id": item_id,
+        "type": type,
+        "category": category,
+        "location": location,
+        "status": status,
+        "image_embedding": vector,
+        "embedding_model": model,
+    }
+
+
+@pytest.fixture
+def index():
+    index = MatchIndex()
+    index.model = MODEL
+    index.upsert(make_item("close", [1.0, 0.1, 0.0]))
+    index.upsert(make_item("closer", [1.0, 0.0, 0.0], category="Electronics"))
+    index.upsert(make_item("far", [0.0, 1.0, 0.0], location="Canteen"))
+    index.upsert(make_item("lost-one", [1.0, 0.0, 0.0], type="lost"))
+    return index
+
+
+def ids(results):
+    return [item_id for item_id, _ in results]
+
+
+def test_search_orders_by_score(index):
+    results = index.search([2.0, 0.0, 0.0], item_type="found")
+    assert ids(results) == ["closer", "close", "far"]
+    assert results[0][1] == pytest.approx(1.0)
+
+
+def test_search_filters(index):
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="lost")) == ["lost-one"]
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="found", category="Bags")) == ["close", "far"]
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="found", location="Canteen")) == ["far"]
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="found", exclude="closer")) == ["close", "far"]
+
+
+def test_search_threshold_and_k(index):
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="found", threshold=0.5)) == ["closer", "close"]
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="found", k=1)) == ["closer"]
+    assert set(ids(index.search([1.0, 0.0, 0.0], k=2))) == {"closer", "lost-one"}
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="found", threshold=0.5, k=5)) == ["closer", "close"]
+
+
+def test_upsert_drops_inactive_and_other_model_vectors(index):
+    index.upsert(make_item("close", [1.0, 0.1, 0.0], status="resolved"))
+    index.upsert(make_item("closer", [1.0, 0.0, 0.0], model="clip-ViT-L-14"))
+    assert ids(index.search([1.0, 0.0, 0.0], item_type="found")) == ["far"]
+
+
+def test_search_empty_index():
+    index = MatchIndex()
+    index.model = MODEL
+    assert index.search([1.0, 0.0]) == []
+
+
+class FakeCursor:
+    """Async iterator over docs that runs a callback after yielding the given position."""
+
+    def __init__(self, docs, during=None, at=0):
+        self.docs = docs
+        self.during = during
+        self.at = at
+
+    async def __aiter__(self):
+        for position, doc in enumerate(self.docs):
+            yield doc
+            if self.during and position == self.at:
+                self.during()
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    state = SimpleNamespace(docs=[], during=None, loads=0)
+
+    def find(query, projection=None):
+        state.loads += 1
+        during, state.during = state.during, None
+        return FakeCursor(list(state.docs), during)
+
+    async def get_active_embedding_model():
+        return MODEL
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(items=SimpleNamespace(find=find)))
+    monkeypatch.setattr(server, "get_active_embedding_model", get_active_embedding_model)
+    return state
+
+
+def test_event_during_load_is_applied(stored):
+    stored.docs = [make_item("a", [1.0, 0.0, 0.0]), make_item("b", [0.0, 1.0, 0.0])]
+    index = MatchIndex()
+
+    def resolve_a():
+        # The scan already passed "a" when it is resolved elsewhere
+        index.handle_event({"op": "update", "key": "a", "doc": make_item("a", [1.0, 0.0, 0.0], status="resolved")})
+
+    stored.during = resolve_a
+    asyncio.run(index.ensure_loaded())
+    assert index.loaded
+    assert stored.loads == 1
+    assert list(index.entries) == ["b"]
+
+
+def test_events_are_ignored_while_unloaded():
+    index = MatchIndex()
+    index.model = MODEL
+    index.handle_event({"op": "insert", "key": "a", "doc": make_item("a", [1.0, 0.0, 0.0])})
+    assert index.entries == {}
+
+
+def test_invalidation_during_load_reloads(stored):
+    stored.docs = [make_item("a", [1.0, 0.0, 0.0])]
+    index = MatchIndex()
+
+    def switch_models():
+        stored.docs = [make_item("b", [0.0, 1.0, 0.0])]
+        index.handle_event({"op": "reset", "key": None, "doc": None})
+
+    stored.during = switch_models
+    asyncio.run(index.ensure_loaded())
+    assert stored.loads == 2
+    assert index.loaded
+    assert list(index.entries) == ["b"]
+
+
+def test_invalidate_bumps_generation(index):
+    generation = index.generation
+    index.loaded = True
+    index.invalidate()
+    assert index.generation == generation + 1
+    assert not index.loaded
+
+
+class StopPolling(Exception):
+    pass
+
+
+def test_poll_survives_a_failed_first_read(monkeypatch):
+    reads = []
+    published = []
+
+    async def find_one(query):
+        reads.append(query)
+        if len(reads) == 1:
+            raise ConnectionError("no primary")
+        return {"_id": "embedding", "active_model": MODEL}
+
+    async def sleep(seconds):
+        if len(reads) >= 3:
+            raise StopPolling
+
+    def find(query, projection=None):
+        return FakeCursor([])
+
+    collection = SimpleNamespace(find=find)
+    monkeypatch.setattr(server, "db", SimpleNamespace(items=collection, matches=collection, settings=SimpleNamespace(find_one=find_one)))
+    monkeypatch.setattr(server.asyncio, "sleep", sleep)
+    monkeypatch.setattr(server.invalidation_bus, "mode", server.invalidation_bus.mode)
+    monkeypatch.setattr(server.invalidation_bus, "publish", lambda collection, op, key=None, doc=None: published.append((collection, op)))
+    with pytest.raises(StopPolling):
+        asyncio.run(poll_changes())
+    # The first successful read publishes once; an unchanged document does not
+    assert published == [("settings", "update")]
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import save_match
+
+
+class FakeMatches:
+    """Upsert with $setOnInsert on an equality filter, like db.matches.find_one_and_update."""
+
+    def __init__(self):
+        self.docs = []
+
+    async def find_one_and_update(self, query, update, upsert=False, projection=None, return_document=None):
+        for doc in self.docs:
+            if all(doc.get(key) == value for key, value in query.items()):
+                return doc
+        doc = {**update["$setOnInsert"], **query}
+        self.docs.append(doc)
+        return doc
+
+
+@pytest.fixture
+def matches(monkeypatch):
+    collection = FakeMatches()
+    jobs = []
+    touched = []
+
+    async def enqueue_job(kind, payload, idempotency_key=None, run_at=None):
+        jobs.append(idempotency_key)
+
+    async def touch_items(item_ids):
+        touched.append(sorted(item_ids))
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(matches=collection))
+    monkeypatch.setattr(server, "enqueue_job", enqueue_job)
+    monkeypatch.setattr(server, "touch_items", touch_items)
+    return SimpleNamespace(collection=collection, jobs=jobs, touched=touched)
+
+
+def test_pair_is_stored_once_whichever_item_finds_it(matches):
+    async def both_jobs():
+        await save_match("lost-b", "found-a", 0.9)
+        await save_match("found-a", "lost-b", 0.9)
+
+    asyncio.run(both_jobs())
+    assert len(matches.collection.docs) == 1
+    doc = matches.collection.docs[0]
+    assert (doc["item1_id"], doc["item2_id"]) == ("found-a", "lost-b")
+    # Both calls queue the same idempotency key, so only one notification job exists
+    assert matches.jobs == [f"notify_match:{doc['id']}"] * 2
+    assert matches.touched == [["found-a", "lost-b"]] * 2
+
+
+def test_lost_upsert_race_reads_the_winner(matches, monkeypatch):
+    calls = []
+    find_one_and_update = matches.collection.find_one_and_update
+
+    async def racing(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            await find_one_and_update(*args, **kwargs)
+            raise server.DuplicateKeyError("E11000 duplicate key")
+        return await find_one_and_update(*args, **kwargs)
+
+    monkeypatch.setattr(matches.collection, "find_one_and_update", racing)
+    asyncio.run(save_match("a", "b", 0.8))
+    assert len(calls) == 2
+    assert len(matches.collection.docs) == 1
+    assert len(matches.jobs) == 1
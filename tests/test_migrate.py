@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from migrate import migrate_field, parse_timestamp
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-11-08T09:30:00+00:00", datetime(2025, 11, 8, 9, 30, tzinfo=timezone.utc)),
+    ("2025-11-08T09:30:00.123456Z", datetime(2025, 11, 8, 9, 30, 0, 123456, tzinfo=timezone.utc)),
+    # Naive strings are taken as UTC
+    ("2025-11-08T09:30:00", datetime(2025, 11, 8, 9, 30, tzinfo=timezone.utc)),
+    ("2025-11-08T15:00:00+05:30", datetime(2025, 11, 8, 9, 30, tzinfo=timezone.utc)),
+])
+def test_parse_timestamp(value, expected):
+    parsed = parse_timestamp(value)
+    assert parsed.tzinfo is not None
+    assert parsed == expected
+
+
+def test_parse_timestamp_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_timestamp("last tuesday")
+
+
+class FakeCollection:
+    """find(...).sort(...).limit(...).to_list(...) over string-valued fields, plus bulk_write."""
+
+    name = "items"
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection):
+        field = next(key for key in query if key != "_id")
+        after = query.get("_id", {}).get("$gt", -1)
+        matches = sorted(
+            (doc for doc in self.docs if isinstance(doc.get(field), str) and doc["_id"] > after),
+            key=lambda doc: doc["_id"]
+        )
+        chain = SimpleNamespace()
+        chain.sort = lambda *args: chain
+        chain.limit = lambda n: SimpleNamespace(to_list=lambda length: self.to_list(matches[:n]))
+        return chain
+
+    async def to_list(self, docs):
+        return [dict(doc) for doc in docs]
+
+    async def bulk_write(self, operations, ordered=True):
+        modified = 0
+        for operation in operations:
+            query, update = operation._filter, operation._doc
+            for doc in self.docs:
+                if all(doc.get(key) == value for key, value in query.items()):
+                    doc.update(update["$set"])
+                    modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+
+def test_migrate_field_converts_strings_in_batches():
+    already = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    docs = [{"_id": n, "created_at": f"2025-11-0{n}T10:00:00Z"} for n in range(1, 6)]
+    docs += [{"_id": 6, "created_at": already}, {"_id": 7, "created_at": "not a date"}]
+    collection = FakeCollection(docs)
+
+    converted = asyncio.run(migrate_field(collection, "created_at", batch_size=2))
+    assert converted == 5
+    assert docs[0]["created_at"] == datetime(2025, 11, 1, 10, tzinfo=timezone.utc)
+    assert docs[5]["created_at"] is already
+    # Unparseable values are logged and left for a human
+    assert docs[6]["created_at"] == "not a date"
+    # Safe to re-run
+    assert asyncio.run(migrate_field(collection, "created_at", batch_size=2)) == 0
@@ -0,0 +1,38 @@
+import random
+
+from server import PHASH_BANDS, phash_bands, phash_distance
+
+
+def flip_bits(phash, bits):
+    value = int(phash, 16)
+    for bit in bits:
+        value ^= 1 << bit
+    return f"{value:016x}"
+
+
+def test_phash_distance():
+    assert phash_distance("0000000000000000", "0000000000000000") == 0
+    assert phash_distance("0000000000000000", "ffffffffffffffff") == 64
+    assert phash_distance("00000000000000ff", "0000000000000000") == 8
+
+
+def test_phash_bands_split_hash():
+    bands = phash_bands("0123456789abcdef")
+    assert bands == ["0:0123", "1:4567", "2:89ab", "3:cdef"]
+
+
+def test_three_bit_difference_always_shares_a_band():
+    # With 4 bands, 3 flipped bits leave at least one band untouched, so the $in lookup finds it
+    assert PHASH_BANDS == 4
+    rng = random.Random(1234)
+    for _ in range(2000):
+        phash = f"{rng.getrandbits(64):016x}"
+        other = flip_bits(phash, rng.sample(range(64), 3))
+        assert phash_distance(phash, other) == 3
+        assert set(phash_bands(phash)) & set(phash_bands(other))
+
+
+def test_one_bit_in_every_band_shares_none():
+    phash = "0000000000000000"
+    other = flip_bits(phash, [0, 16, 32, 48])
+    assert not set(phash_bands(phash)) & set(phash_bands(other))
@@ -0,0 +1,48 @@
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import server
+from server import TokenBucketLimiter, User, search_by_image
+
+
+class NoDatabase:
+    def __getattr__(self, name):
+        raise AssertionError(f"search touched db.{name}")
+
+
+@pytest.fixture
+def searcher(monkeypatch):
+    monkeypatch.setattr(server, "db", NoDatabase())
+    monkeypatch.setattr(server, "search_limiter", TokenBucketLimiter(rate_per_minute=6, burst=1))
+    monkeypatch.setattr(server, "image_search_cache", {})
+    return User(id="u1", email="u1@cvru.ac.in", name="U", picture="")
+
+
+def search(user, data=b"photo"):
+    return asyncio.run(search_by_image(image=UploadFile(io.BytesIO(data)), type="lost", k=5, user=user))
+
+
+def test_search_limit_is_separate_from_uploads_and_writes_nothing(searcher):
+    server.search_limiter.acquire(searcher.id)
+    with pytest.raises(HTTPException) as error:
+        search(searcher)
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+    # The shared upload buckets (and their rate_limits documents) were never consulted
+    for limiter in (server.user_upload_limiter, server.ip_upload_limiter):
+        assert limiter.stats()["allowed"] == limiter.stats()["rejected"] == 0
+
+
+def test_cached_search_skips_the_limit(searcher, monkeypatch):
+    server.search_limiter.acquire(searcher.id)
+    key = (server.hashlib.sha256(b"photo").hexdigest(), "lost", 5)
+    server.image_search_cache[key] = []
+
+    async def ranked_items(scored):
+        return []
+
+    monkeypatch.setattr(server, "ranked_items", ranked_items)
+    assert search(searcher).body == b"[]"